@@ -1,8 +1,7 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING, Any, List, Optional, Self
-import copy
 
-from topicsync.utils import IdGenerator
+from topicsync.utils import IdGenerator, clone_value
 from topicsync.string_diff import insert, delete, adjust_delete, extend_delete
 
 if TYPE_CHECKING:
@@ -31,25 +30,24 @@ default_topic_value = {
     'event':None
 }
 
-def remove_entry(dictionary,key):
-    dictionary = dictionary.copy()
-    if key in dictionary:
-        del dictionary[key]
-    return dictionary
-
 def type_validator(*ts):
+    if len(ts) == 1:
+        t = ts[0]
+        def f(new_value,change):
+            # the exact type check is a fast path, isinstance still accepts subclasses
+            return type(new_value) is t or isinstance(new_value,t)
+        return f
     def f(new_value,change):
-        for t in ts:
-            if isinstance(new_value,t):
-                return True
-        return False
+        return isinstance(new_value,ts)
     return f
 
 class Change:
+    __slots__ = ('topic_name','_id')
     @staticmethod
     def deserialize(change_dict:dict[str,Any])->Change:
-        change_type, topic_type, change_dict = change_dict['type'], change_dict['topic_type'], remove_entry(remove_entry(change_dict,'type'),'topic_type')
-        return type_name_to_change_types[topic_type].types[change_type].deserialize_init(change_dict)
+        change_dict = change_dict.copy() # the caller may still use change_dict
+        topic_type, change_type = change_dict.pop('topic_type'), change_dict.pop('type')
+        return change_type_table[topic_type,change_type].deserialize_init(change_dict)
 
     @classmethod
     def deserialize_init(cls, change_dict: dict[str, Any]) -> Self:
@@ -57,11 +55,21 @@ class Change:
 
     def __init__(self,topic_name,id:Optional[str]=None):
         self.topic_name = topic_name
-        if id is None:
-            self.id = IdGenerator.generate_id()
-        else:
-            self.id = id
+        self._id = id
+    @property
+    def id(self)->str:
+        # The id is generated on first access because many changes (e.g. the inverses) never need one.
+        if self._id is None:
+            self._id = IdGenerator.generate_id()
+        return self._id
+    @id.setter
+    def id(self, value:str):
+        self._id = value
     def apply(self, old_value):
+        '''
+        Return the value of the topic after the change. The topic hands over its current value, so apply() may modify old_value in
+        place and return it. The returned value must not be shared with the change, since the topic may modify it later.
+        '''
         return old_value
     def serialize(self)->dict[str,Any]:
         '''
@@ -77,6 +85,7 @@ class Change:
         raise NotImplementedError()
 
 class NullChange(Change):
+    __slots__ = ()
     def __init__(self,topic_name,id=None):
         super().__init__(topic_name,id)
     def apply(self, old_value):
@@ -87,12 +96,23 @@ class NullChange(Change):
         raise NotImplementedError('NullChange should be discarded before serialization.')
 
 class SetChange(Change):
+    __slots__ = ('value','old_value')
+    # Subclasses for str, int and float topics set this to True, so value and old_value are stored without copying.
+    IMMUTABLE_VALUE = False
+    # Subclasses set _TOPIC_TYPE so serialize() doesn't have to be overridden.
+    _TOPIC_TYPE = 'unknown'
+    _CHANGE_TYPE = 'set'
     def __init__(self,topic_name, value,old_value=None,id=None):
         super().__init__(topic_name,id)
-        self.value = copy.deepcopy(value)
-        self.old_value = copy.deepcopy(old_value)
+        self.value = self._clone(value)
+        self.old_value = self._clone(old_value)
+    def _clone(self, value):
+        if self.IMMUTABLE_VALUE:
+            return value
+        return clone_value(value)
     def apply(self, old_value):
-        old_value = copy.deepcopy(old_value)
+        # old_value is also passed to listeners (e.g. on_set2's before), so keep a private copy for undo.
+        old_value = self._clone(old_value)
         # if self.old_value != None:
         #     #? Is it correct?
         #     assert old_value == self.old_value, f'old_value: {old_value} != self.old_value: {self.old_value}'
@@ -104,11 +124,21 @@ class SetChange(Change):
     
         
         self.old_value = old_value
-        return copy.deepcopy(self.value)
+        # The topic may modify the returned value in place (e.g. list insert), so it must not be self.value.
+        return self._clone(self.value)
     def inverse(self)->Change:
-        return self.__class__(self.topic_name,copy.deepcopy(self.old_value),copy.deepcopy(self.value))
+        # __init__ clones the values, so no need to copy them here
+        return self.__class__(self.topic_name,self.old_value,self.value)
+    def __deepcopy__(self, memo):
+        # Values are JSON-like and never contain cycles, so skip the generic deepcopy machinery.
+        new = object.__new__(type(self))
+        new.topic_name = self.topic_name
+        new._id = self.id
+        new.value = self._clone(self.value)
+        new.old_value = self._clone(self.old_value)
+        return new
     def serialize(self):
-        return {"topic_name":self.topic_name,"topic_type":"unknown","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        return {"topic_name":self.topic_name,"topic_type":self._TOPIC_TYPE,"type":self._CHANGE_TYPE,"value":self.value,"old_value":self.old_value,"id":self.id}
     def __eq__(self, other):
         if type(self) != type(other):
             # type will return the immediate type (simply, subtype), so we use type and compare them directly
@@ -122,19 +152,21 @@ class SetChange(Change):
 
 class GenericChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"generic","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        _TOPIC_TYPE = 'generic'
 
     types = {'set':SetChange}
 
 class StringChangeTypes:
     class SetChange(SetChange):
+        __slots__ = ()
+        IMMUTABLE_VALUE = True
+        _TOPIC_TYPE = 'string'
         def exchange_topic_version(self, current_version: str, topic: StringTopic) -> str:
             return self.id
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"string","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
 
     class InsertChange(Change):
+        __slots__ = ('position','insertion','topic_version','result_topic_version')
         def __init__(self, topic_name: str, topic_version: str, position: int, insertion: str, result_topic_version: Optional[str] = None, id: Optional[str]=None):
             super().__init__(topic_name, id)
             self.position = position
@@ -200,6 +232,7 @@ class StringChangeTypes:
                 self.id == other.id
 
     class DeleteChange(Change):
+        __slots__ = ('position','deletion','topic_version','result_topic_version')
         def __init__(self, topic_name: str, topic_version: str, position: int, deletion: str, result_topic_version: Optional[str]=None, id: Optional[str]=None):
             super().__init__(topic_name, id)
             self.position = position
@@ -269,10 +302,12 @@ class StringChangeTypes:
 
 class IntChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"int","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        IMMUTABLE_VALUE = True
+        _TOPIC_TYPE = 'int'
 
     class AddChange(Change):
+        __slots__ = ('value',)
         def __init__(self,topic_name, value,id=None):
             super().__init__(topic_name,id)
             self.value = value
@@ -282,6 +317,9 @@ class IntChangeTypes:
             return {"topic_name":self.topic_name,"topic_type":"int","type":"add","value":self.value,"id":self.id}
         def inverse(self)->Change:
             return IntChangeTypes.AddChange(self.topic_name,-self.value)
+        def __deepcopy__(self, memo):
+            # All fields are immutable, so skip the generic deepcopy machinery.
+            return type(self)(self.topic_name,self.value,self.id)
         def __eq__(self, other):
             if not isinstance(other, IntChangeTypes.AddChange):
                 return False
@@ -293,10 +331,12 @@ class IntChangeTypes:
 
 class FloatChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"float","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        IMMUTABLE_VALUE = True
+        _TOPIC_TYPE = 'float'
 
     class AddChange(Change):
+        __slots__ = ('value',)
         def __init__(self,topic_name, value,id=None):
             super().__init__(topic_name,id)
             self.value = value
@@ -306,6 +346,9 @@ class FloatChangeTypes:
             return {"topic_name":self.topic_name,"topic_type":"float","type":"add","value":self.value,"id":self.id}
         def inverse(self)->Change:
             return IntChangeTypes.AddChange(self.topic_name,-self.value)
+        def __deepcopy__(self, memo):
+            # All fields are immutable, so skip the generic deepcopy machinery.
+            return type(self)(self.topic_name,self.value,self.id)
         def __eq__(self, other):
             if not isinstance(other, FloatChangeTypes.AddChange):
                 return False
@@ -317,9 +360,10 @@ class FloatChangeTypes:
 
 class SetChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-                return {"topic_name":self.topic_name,"topic_type":"set","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        _TOPIC_TYPE = 'set'
     class AppendChange(Change):
+        __slots__ = ('item',)
         def __init__(self,topic_name, item,id=None):
             super().__init__(topic_name,id)
             self.item = item
@@ -331,6 +375,8 @@ class SetChangeTypes:
             return {"topic_name":self.topic_name,"topic_type":"set","type":"append","item":self.item,"id":self.id}
         def inverse(self)->Change:
             return SetChangeTypes.RemoveChange(self.topic_name,self.item)
+        def __deepcopy__(self, memo):
+            return type(self)(self.topic_name,clone_value(self.item),self.id)
         def __eq__(self, other):
             if not isinstance(other, SetChangeTypes.AppendChange):
                 return False
@@ -339,6 +385,7 @@ class SetChangeTypes:
                 self.id == other.id
 
     class RemoveChange(Change):
+        __slots__ = ('item',)
         def __init__(self,topic_name, item,id=None):
             super().__init__(topic_name,id)
             self.item = item
@@ -352,6 +399,8 @@ class SetChangeTypes:
             return {"topic_name":self.topic_name,"topic_type":"set","type":"remove","item":self.item,"id":self.id}
         def inverse(self)->Change:
             return SetChangeTypes.AppendChange(self.topic_name,self.item)
+        def __deepcopy__(self, memo):
+            return type(self)(self.topic_name,clone_value(self.item),self.id)
         def __eq__(self, other):
             if not isinstance(other, SetChangeTypes.RemoveChange):
                 return False
@@ -363,10 +412,11 @@ class SetChangeTypes:
 
 class ListChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"list","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        _TOPIC_TYPE = 'list'
 
     class InsertChange(Change):
+        __slots__ = ('item','position')
         def __init__(self,topic_name, item,position:int,id=None):
             super().__init__(topic_name,id)
             self.item = item
@@ -389,6 +439,7 @@ class ListChangeTypes:
                 self.position == other.position and \
                 self.id == other.id
     class PopChange(Change):
+        __slots__ = ('position','item')
         def __init__(self,topic_name, position:int,id=None):
             super().__init__(topic_name,id)
             self.position = position
@@ -412,9 +463,10 @@ class ListChangeTypes:
 
 class DictChangeTypes:
     class SetChange(SetChange):
-        def serialize(self):
-            return {"topic_name":self.topic_name,"topic_type":"dict","type":"set","value":self.value,"old_value":self.old_value,"id":self.id}
+        __slots__ = ()
+        _TOPIC_TYPE = 'dict'
     class AddChange(Change):
+        __slots__ = ('key','value')
         def __init__(self,topic_name, key,value,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -436,6 +488,7 @@ class DictChangeTypes:
                 self.value == other.value and \
                 self.id == other.id
     class PopChange(Change):
+        __slots__ = ('key','value')
         def __init__(self,topic_name, key,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -456,6 +509,7 @@ class DictChangeTypes:
                 self.key == other.key and \
                 self.id == other.id
     class ChangeValueChange(Change):
+        __slots__ = ('key','value','old_value')
         def __init__(self,topic_name, key,value,old_value=None,id=None):
             super().__init__(topic_name,id)
             self.key = key
@@ -466,7 +520,7 @@ class DictChangeTypes:
                 raise InvalidChangeError(self,f'{self.key} is not in {old_dict}')
             if self.old_value != old_dict[self.key]:
                 # regenerate id
-                self.id = IdGenerator.generate_id()
+                self._id = None
             self.old_value = old_dict[self.key]
             old_dict[self.key] = self.value
             return old_dict
@@ -486,6 +540,7 @@ class DictChangeTypes:
 
 class EventChangeTypes:
     class EmitChange(Change):
+        __slots__ = ('args','forward_info')
         def __init__(self,topic_name,args=None,id=None,forward_info=None):
             super().__init__(topic_name,id)
             self.args = args if args is not None else {}
@@ -506,6 +561,7 @@ class EventChangeTypes:
                 self.forward_info == other.forward_info and \
                 self.id == other.id
     class ReversedEmitChange(Change):
+            __slots__ = ('args','forward_info')
             def __init__(self,topic_name,args=None,id=None,forward_info=None):
                 super().__init__(topic_name,id)
                 self.args = args if args is not None else {}
@@ -535,3 +591,10 @@ type_name_to_change_types = {
                                 'list':ListChangeTypes,
                                 'event':EventChangeTypes
                             }
+
+# (topic type name, change type name) -> change class, used by Change.deserialize
+change_type_table: dict[tuple[str,str],type[Change]] = {
+    (topic_type,change_type):change_class
+    for topic_type,change_types in type_name_to_change_types.items()
+    for change_type,change_class in change_types.types.items()
+}
@@ -1,6 +1,7 @@
 import asyncio
 import json
 import logging
+import re
 from topicsync.server.update_buffer import UpdateBuffer
 
 from topicsync.state_machine.state_machine import (
@@ -17,17 +18,64 @@ from collections import defaultdict
 
 from topicsync.change import Change
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # A run of 20 digits is the shortest form of an integer beyond 64 bits. orjson decodes those as floats.
+    _LONG_DIGIT_RUN = re.compile(r"\d{20}")
+
+    def encode_json(obj) -> str:
+        """
+        Unlike json.dumps, NaN and Infinity are encoded as null. Clients parse messages as strict JSON, which has no NaN.
+        """
+        try:
+            encoded = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson can't encode some values json can, e.g. integers beyond 64 bits
+            return json.dumps(obj, separators=(",", ":"))
+        # orjson returns bytes. Decode them so messages are still sent as text frames.
+        return encoded.decode()
+
+    def decode_json(message: str):
+        if _LONG_DIGIT_RUN.search(message):
+            # may contain an integer beyond 64 bits, which json keeps exact
+            return json.loads(message)
+        try:
+            return orjson.loads(message)
+        except orjson.JSONDecodeError:
+            # json accepts some input orjson rejects, e.g. NaN and lone surrogates
+            return json.loads(message)
+
+else:
+    encode_json = json.dumps
+    decode_json = json.loads
+
 
 def make_message(message_type, **kwargs) -> str:
     try:
-        return json.dumps({"type": message_type, "args": kwargs})
+        return encode_json({"type": message_type, "args": kwargs})
     except Exception as e:
         logger.error(f"Error encoding message {str(kwargs)[:300]}")
         raise ValueError(f"Error encoding message {message_type}: {e}") from e
 
 
+# Only the changes and the action_id vary between update messages, so the rest of the message is a fixed template.
+_UPDATE_TEMPLATE = '{"type":"update","args":{"changes":[%s],"action_id":%s}}'
+
+
+def make_update_message(changes: List[str], action_id: str) -> str:
+    """
+    Build an "update" message from changes that are already JSON encoded, so a change sent to many clients is only encoded once.
+    Use make_message for other message types.
+    """
+    return _UPDATE_TEMPLATE % (",".join(changes), encode_json(action_id))
+
+
 def parse_message(message_json) -> Tuple[str, dict]:
-    message = json.loads(message_json)
+    message = decode_json(message_json)
     return message["type"], message["args"]
 
 
@@ -62,9 +110,14 @@ class Client:
         await self._comm.send(message)
         logger.debug(f"<{self.id} {message[:100]}")
 
-    async def send_async(self, *args, **kwargs):
+    async def send_async(self, message_type, **kwargs):
         try:
-            await self._send_raw(make_message(*args, **kwargs))
+            if message_type == "update":
+                # changes of update messages are encoded in advance by ClientManager.send_update
+                message = make_update_message(**kwargs)
+            else:
+                message = make_message(message_type, **kwargs)
+            await self._send_raw(message)
         except Exception as e:
             print("Error sending message to client", e)
             raise
@@ -82,11 +135,15 @@ class ClientManager:
         self._state_machine = state_machine
         self._clients: Dict[int, Client] = {}
         self._client_id_count = count(1)
-        self._message_handlers: Dict[str, Callable[..., None | Awaitable[None]]] = {
+        # Handlers are sorted by whether they are async when registered, so dispatching doesn't need to check the return value
+        self._sync_message_handlers: Dict[str, Callable[..., None]] = {
             "subscribe": self._handle_subscribe,
             "unsubscribe": self._handle_unsubscribe,
         }
+        self._async_message_handlers: Dict[str, Callable[..., Awaitable[None]]] = {}
         self._subscriptions: defaultdict[str, set] = defaultdict(set)
+        # reverse index of _subscriptions, so cleaning up a client doesn't scan every topic
+        self._client_subscriptions: defaultdict[int, set] = defaultdict(set)
         self._sending_queue: asyncio.Queue[Tuple[Client, Tuple, Dict]] = asyncio.Queue()
 
         self._update_buffer = UpdateBuffer(self._state_machine, self.send_update)
@@ -96,11 +153,42 @@ class ClientManager:
     async def run(self):
         asyncio.get_event_loop().create_task(self._update_buffer.run())
         while True:
-            client, args, kwargs = await self._sending_queue.get()
-            try:
-                await client.send_async(*args, **kwargs)
-            except Exception:
-                self._cleanup_client(client)
+            items = [await self._sending_queue.get()]
+            # Take everything else that is waiting too, so updates can be merged into fewer messages
+            while not self._sending_queue.empty():
+                items.append(self._sending_queue.get_nowait())
+
+            for client, args, kwargs in self._merge_updates(items):
+                if client.id not in self._clients:
+                    # The client disconnected while its messages were waiting
+                    continue
+                try:
+                    await client.send_async(*args, **kwargs)
+                except Exception:
+                    self._cleanup_client(client)
+
+    def _merge_updates(
+        self, items: List[Tuple[Client, Tuple, Dict]]
+    ) -> List[Tuple[Client, Tuple, Dict]]:
+        """
+        Merge consecutive update messages to the same client with the same action_id into one message.
+        Only messages that are adjacent in the client's own sequence are merged, so each client receives its messages in order.
+        """
+        merged: List[Tuple[Client, Tuple, Dict]] = []
+        last_index_of_client: Dict[int, int] = {}
+        for client, args, kwargs in items:
+            last_index = last_index_of_client.get(client.id)
+            if last_index is not None and args == ("update",):
+                _, last_args, last_kwargs = merged[last_index]
+                if (
+                    last_args == ("update",)
+                    and last_kwargs["action_id"] == kwargs["action_id"]
+                ):
+                    last_kwargs["changes"] = last_kwargs["changes"] + kwargs["changes"]
+                    continue
+            last_index_of_client[client.id] = len(merged)
+            merged.append((client, args, kwargs))
+        return merged
 
     def send(self, client: Client, *args, **kwargs):
         self._sending_queue.put_nowait((client, args, kwargs))
@@ -124,16 +212,17 @@ class ClientManager:
                 logger.debug(f"> {message[:100]}")
 
                 message_type, args = parse_message(message)
-                if message_type not in self._message_handlers:
+                sync_handler = self._sync_message_handlers.get(message_type)
+                async_handler = self._async_message_handlers.get(message_type)
+                if sync_handler is None and async_handler is None:
                     logger.error(f"Unknown message type: {message_type}")
                     continue
 
                 try:
-                    return_value = self._message_handlers[message_type](
-                        sender=client, **args
-                    )
-                    if isinstance(return_value, Awaitable):
-                        await return_value
+                    if sync_handler is not None:
+                        sync_handler(sender=client, **args)
+                    else:
+                        await async_handler(sender=client, **args)
                 except Exception as e:
                     if (
                         not hasattr(e, "__notes__")
@@ -160,36 +249,58 @@ class ClientManager:
         """
         Broadcast a list of changes to all clients subscribed to the topics in the changes.
         """
+        subscriptions = self._subscriptions
+        clients = self._clients
+        send = self.send
+
+        # Encode every change before sending anything, so a change that can't be encoded drops the whole update
+        # instead of leaving the clients with part of it. Don't raise: this runs inside StateMachine.record()'s
+        # cleanup and the update buffer's clock, and both must keep working.
         messages_for_client = defaultdict(list)
         for change in changes:
-            for client_id in self._subscriptions[change.topic_name]:
-                messages_for_client[client_id].append(change.serialize())
-
-        for client_id in messages_for_client:
-            client = self._clients[client_id]
-            self.send(
-                client,
-                "update",
-                changes=messages_for_client[client_id],
-                action_id=action_id,
-            )
+            subscribers = subscriptions.get(change.topic_name)
+            if not subscribers:
+                continue
+            # serialize and encode once, no matter how many clients subscribed to the topic
+            serialized = change.serialize()
+            try:
+                encoded_change = encode_json(serialized)
+            except Exception:
+                logger.error(
+                    f"Error encoding change {str(serialized)[:300]}. Update {action_id} is not sent:\n{traceback.format_exc()}"
+                )
+                return
+            for client_id in subscribers:
+                messages_for_client[client_id].append(encoded_change)
+
+        for client_id, messages in messages_for_client.items():
+            client = clients.get(client_id)
+            if client is None:
+                # The client disconnected but is still in the subscriptions
+                continue
+            send(client, "update", changes=messages, action_id=action_id)
 
     def register_message_handler(
         self, message_type: str, handler: Callable[..., None | Awaitable[None]]
     ):
-        self._message_handlers[message_type] = handler
+        if asyncio.iscoroutinefunction(handler):
+            self._sync_message_handlers.pop(message_type, None)
+            self._async_message_handlers[message_type] = handler
+        else:
+            self._async_message_handlers.pop(message_type, None)
+            self._sync_message_handlers[message_type] = handler
 
     def _cleanup_client(self, client: Client):
         if client.id in self._clients:
             del self._clients[client.id]
-        for topic in self._subscriptions:
-            self._subscriptions[topic].discard(client.id)
+        for topic_name in self._client_subscriptions.pop(client.id, ()):
+            self._subscriptions[topic_name].discard(client.id)
         # clear sending queue with messages for this client
         items_for_other_clients = []
         while not self._sending_queue.empty():
-            client, args, kwargs = self._sending_queue.get_nowait()
-            if client.id != client.id:
-                items_for_other_clients.append((client, args, kwargs))
+            receiver, args, kwargs = self._sending_queue.get_nowait()
+            if receiver.id != client.id:
+                items_for_other_clients.append((receiver, args, kwargs))
         for item in items_for_other_clients:
             self._sending_queue.put_nowait(item)
 
@@ -209,6 +320,7 @@ class ClientManager:
                     continue
 
                 self._subscriptions[topic_name].add(sender.id)
+                self._client_subscriptions[sender.id].add(topic_name)
                 logger.debug(f"Client {sender.id} subscribed to {topic_name}")
                 msg = self._state_machine.get_topic(topic_name).get_init_message()
                 content[topic_name] = msg
@@ -217,6 +329,7 @@ class ClientManager:
 
     def _handle_unsubscribe(self, sender: Client, topic_name: str):
         self._subscriptions[topic_name].discard(sender.id)
+        self._client_subscriptions[sender.id].discard(topic_name)
 
     def set_client_id_count(self, id_count):
         self._client_id_count = count(id_count)
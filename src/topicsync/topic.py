@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import base64
 import collections
-import copy
 import json
 import logging
 
@@ -24,7 +23,7 @@ from topicsync.change import (
     default_topic_value,
     type_validator,
 )
-from topicsync.utils import Action, camel_to_snake
+from topicsync.utils import Action, camel_to_snake, clone_value
 
 if TYPE_CHECKING:
     from topicsync.state_machine.state_machine import StateMachine
@@ -51,9 +50,16 @@ def topic_factory(
 
 
 class Topic(metaclass=abc.ABCMeta):
+    # Same flag as SetChange.IMMUTABLE_VALUE: get() can return the value itself when it can't be mutated.
+    IMMUTABLE_VALUE = False
+
     @classmethod
     def get_type_name(cls):
-        return camel_to_snake(cls.__name__[:-5])
+        # Cached per class. Read from cls.__dict__ so subclasses don't get their parent's cached name.
+        type_name = cls.__dict__.get("_type_name")
+        if type_name is None:
+            type_name = cls._type_name = camel_to_snake(cls.__name__[:-5])
+        return type_name
 
     def __init__(
         self,
@@ -72,7 +78,7 @@ class Topic(metaclass=abc.ABCMeta):
         if init_value is not None:
             self._value = init_value
         else:
-            self._value = copy.deepcopy(default_topic_value[self.get_type_name()])
+            self._value = self._clone(default_topic_value[self.get_type_name()])
 
         self.on_set = Action()
         """args:
@@ -102,6 +108,11 @@ class Topic(metaclass=abc.ABCMeta):
 
         return new_value
 
+    def _clone(self, value):
+        if self.IMMUTABLE_VALUE:
+            return value
+        return clone_value(value)
+
     """
     API
     """
@@ -110,7 +121,7 @@ class Topic(metaclass=abc.ABCMeta):
         return self._name
 
     def get(self):
-        return copy.deepcopy(self._value)
+        return self._clone(self._value)
 
     def get_init_message(self):
         """
@@ -135,7 +146,7 @@ class Topic(metaclass=abc.ABCMeta):
         """
         Set the topic to its default value.
         """
-        self.set(copy.deepcopy(default_topic_value[self.get_type_name()]))
+        self.set(self._clone(default_topic_value[self.get_type_name()]))
 
     @abc.abstractmethod
     def set(self, value):
@@ -285,6 +296,8 @@ class StringTopic(Topic):
     String topic
     """
 
+    IMMUTABLE_VALUE = True
+
     def __init__(
         self,
         name,
@@ -392,6 +405,8 @@ class IntTopic(Topic):
     Int topic
     """
 
+    IMMUTABLE_VALUE = True
+
     def __init__(
         self,
         name,
@@ -444,6 +459,8 @@ class FloatTopic(Topic):
     Int topic
     """
 
+    IMMUTABLE_VALUE = True
+
     def __init__(
         self,
         name,
@@ -470,6 +487,16 @@ class FloatTopic(Topic):
         self.apply_change_external(change)
 
 
+def _freeze(item):
+    """
+    Make an item of a set topic hashable. Lists and dicts are represented by their tagged JSON encoding,
+    so they can't collide with a string holding the same text.
+    """
+    if isinstance(item, (dict, list)):
+        return ("json", json.dumps(item, sort_keys=True, separators=(",", ":")))
+    return item
+
+
 class SetTopic(Topic):
     def __init__(
         self,
@@ -513,14 +540,22 @@ class SetTopic(Topic):
         super().notify_listeners(auto, change, old_value, new_value)
         match change:
             case SetChangeTypes.SetChange():
-                old_value_set = set(map(json.dumps, old_value))
-                new_value_set = set(map(json.dumps, new_value))
-                removed_items = old_value_set - new_value_set
-                added_items = new_value_set - old_value_set
-                for item in removed_items:
-                    self.on_remove.invoke(auto, json.loads(item))
-                for item in added_items:
-                    self.on_append.invoke(auto, json.loads(item))
+                try:
+                    # fast path for sets of hashable items (str, int, ...)
+                    old_value_set, new_value_set = set(old_value), set(new_value)
+                except TypeError:
+                    # key the items by a hashable form, but invoke listeners with the original items
+                    old_items = {_freeze(item): item for item in old_value}
+                    new_items = {_freeze(item): item for item in new_value}
+                    for key in old_items.keys() - new_items.keys():
+                        self.on_remove.invoke(auto, old_items[key])
+                    for key in new_items.keys() - old_items.keys():
+                        self.on_append.invoke(auto, new_items[key])
+                else:
+                    for item in old_value_set - new_value_set:
+                        self.on_remove.invoke(auto, item)
+                    for item in new_value_set - old_value_set:
+                        self.on_append.invoke(auto, item)
             case SetChangeTypes.AppendChange():
                 self.on_append.invoke(auto, change.item)
             case SetChangeTypes.RemoveChange():
@@ -0,0 +1,82 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, ListTopic
+
+class ChangeAliasTestCase(unittest.TestCase):
+    '''
+    Changes recorded in a transition must not share mutable values with the topic,
+    otherwise later in-place changes would modify them.
+    '''
+    def test_set_then_insert(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        topic = machine.add_topic('topic', ListTopic, init_value=[0])
+
+        with machine.record():
+            topic.set([1])
+            topic.insert(2)
+        assert topic.get() == [1, 2]
+        set_change = transitions[0].changes[0]
+        assert set_change.value == [1]
+        assert set_change.old_value == [0]
+
+        machine.undo(transitions[0])
+        assert topic.get() == [0]
+
+        machine.redo(transitions[0])
+        assert topic.get() == [1, 2]
+
+    def test_insert_after_set(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        topic = machine.add_topic('topic', ListTopic, init_value=[0])
+
+        with machine.record():
+            topic.insert(1)
+        with machine.record():
+            topic.set([2])
+        with machine.record():
+            topic.insert(3)
+        assert topic.get() == [2, 3]
+        set_change = transitions[1].changes[0]
+        assert set_change.value == [2]
+        assert set_change.old_value == [0, 1]
+
+        machine.undo(transitions[2])
+        machine.undo(transitions[1])
+        assert topic.get() == [0, 1]
+        machine.undo(transitions[0])
+        assert topic.get() == [0]
+
+    def test_listener_mutates_old_value(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        topic = machine.add_topic('topic', ListTopic, init_value=[0])
+        topic.on_set2 += lambda before, after: before.append('changed by listener')
+
+        with machine.record():
+            topic.set([1])
+        assert transitions[0].changes[0].old_value == [0]
+
+        machine.undo(transitions[0])
+        assert topic.get() == [0]
+
+    def test_dict_set_then_add(self):
+        transitions = []
+        machine = StateMachine(transition_callback=transitions.append)
+        topic = machine.add_topic('topic', DictTopic, init_value={'a': 0})
+
+        with machine.record():
+            topic.set({'b': 1})
+            topic.add('c', 2)
+            topic.change_value('b', 3)
+        assert topic.get() == {'b': 3, 'c': 2}
+        set_change = transitions[0].changes[0]
+        assert set_change.value == {'b': 1}
+        assert set_change.old_value == {'a': 0}
+
+        machine.undo(transitions[0])
+        assert topic.get() == {'a': 0}
+
+        machine.redo(transitions[0])
+        assert topic.get() == {'b': 3, 'c': 2}
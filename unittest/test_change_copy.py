@@ -0,0 +1,40 @@
+import copy
+import unittest
+from topicsync.change import *
+
+
+class TestChangeDeepcopy(unittest.TestCase):
+
+    def _test_deepcopy(self, change):
+        copied = copy.deepcopy(change)
+        self.assertIsNot(change, copied)
+        self.assertEqual(change, copied)
+        return copied
+
+    def test_set_set(self):
+        change = SetChangeTypes.SetChange('topic', [{'a': [1]}], [2])
+        copied = self._test_deepcopy(change)
+        copied.value[0]['a'].append(2)
+        self.assertEqual(change.value, [{'a': [1]}])
+
+    def test_string_set(self):
+        change = StringChangeTypes.SetChange('topic', 'val', 'oval')
+        self._test_deepcopy(change)
+
+    def test_int_add(self):
+        change = IntChangeTypes.AddChange('topic', 10)
+        self._test_deepcopy(change)
+
+    def test_float_add(self):
+        change = FloatChangeTypes.AddChange('topic', 0.2)
+        self._test_deepcopy(change)
+
+    def test_set_append(self):
+        change = SetChangeTypes.AppendChange('topic', {'k': [1]})
+        copied = self._test_deepcopy(change)
+        copied.item['k'].append(2)
+        self.assertEqual(change.item, {'k': [1]})
+
+    def test_set_remove(self):
+        change = SetChangeTypes.RemoveChange('topic', 10)
+        self._test_deepcopy(change)
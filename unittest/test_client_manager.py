@@ -0,0 +1,229 @@
+import asyncio
+import json
+import math
+import unittest
+from topicsync.change import GenericChangeTypes, IntChangeTypes
+from topicsync.server import client_manager as client_manager_module
+from topicsync.server.client_manager import Client, ClientManager, encode_json, parse_message
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import DictTopic, GenericTopic, IntTopic
+
+
+class MockComm:
+    def __init__(self):
+        self.sent = []
+
+    async def messages(self):
+        return
+        yield
+
+    async def send(self, message):
+        self.sent.append(message)
+
+
+def make_client_manager():
+    machine = StateMachine()
+    machine.add_topic('_topicsync/topic_list', DictTopic)
+    machine.add_topic('a', IntTopic)
+    machine.add_topic('g', GenericTopic)
+    return ClientManager(machine)
+
+
+def add_client(client_manager, client_id, topic_names=()):
+    client = Client(client_id, MockComm(), client_manager._sending_queue)
+    client_manager._clients[client_id] = client
+    for topic_name in topic_names:
+        client_manager._subscriptions[topic_name].add(client_id)
+        client_manager._client_subscriptions[client_id].add(topic_name)
+    return client
+
+
+def queued_items(client_manager):
+    items = []
+    while not client_manager._sending_queue.empty():
+        items.append(client_manager._sending_queue.get_nowait())
+    return items
+
+
+class SendUpdateTestCase(unittest.TestCase):
+    def test_unencodable_change_drops_whole_update(self):
+        client_manager = make_client_manager()
+        add_client(client_manager, 1, ['a', 'g'])
+        changes = [
+            IntChangeTypes.AddChange('a', 1),
+            GenericChangeTypes.SetChange('g', object()),
+        ]
+        client_manager.send_update(changes, 'action')
+        self.assertEqual(queued_items(client_manager), [])
+
+    def test_unencodable_change_in_record(self):
+        client_manager = make_client_manager()
+        machine = client_manager._state_machine
+        machine._changes_callback = client_manager.send_update_buffered  # as TopicsyncServer does
+        add_client(client_manager, 1, ['a', 'g'])
+        a = machine.get_topic('a')
+        g = machine.get_topic('g')
+
+        with machine.record():
+            g.set({1, 2})
+        self.assertEqual(queued_items(client_manager), [])
+
+        # the state machine can still record, and later updates are sent
+        with machine.record():
+            a.set(3)
+        [(client, args, kwargs)] = queued_items(client_manager)
+        self.assertEqual(json.loads(kwargs['changes'][0])['value'], 3)
+
+
+class EncodeJsonTestCase(unittest.TestCase):
+    def test_plain_values(self):
+        obj = {'a': [1, 2.5, 'x', None, True], 1: {'b': 'c'}}
+        self.assertEqual(json.loads(encode_json(obj)), json.loads(json.dumps(obj)))
+
+    @unittest.skipIf(client_manager_module.orjson is None, 'orjson is not installed')
+    def test_orjson_path(self):
+        self.assertEqual(encode_json({'a': [1, 'x']}), '{"a":[1,"x"]}')
+
+    def test_big_int(self):
+        value = 2 ** 70
+        self.assertEqual(json.loads(encode_json({'value': value})), {'value': value})
+
+    @unittest.skipIf(client_manager_module.orjson is None, 'orjson is not installed')
+    def test_nan_and_infinity_orjson(self):
+        self.assertEqual(encode_json([math.nan, math.inf, -math.inf, None]), '[null,null,null,null]')
+
+    @unittest.skipIf(client_manager_module.orjson is not None, 'orjson is installed')
+    def test_nan_and_infinity_json(self):
+        decoded = json.loads(encode_json([math.nan, math.inf, -math.inf, None]))
+        self.assertTrue(math.isnan(decoded[0]))
+        self.assertEqual(decoded[1:], [math.inf, -math.inf, None])
+
+    def test_send_update_with_big_int(self):
+        client_manager = make_client_manager()
+        add_client(client_manager, 1, ['a'])
+        client_manager.send_update([IntChangeTypes.SetChange('a', 2 ** 70, 0)], 'action')
+        [(client, args, kwargs)] = queued_items(client_manager)
+        self.assertEqual(json.loads(kwargs['changes'][0])['value'], 2 ** 70)
+
+
+class ParseMessageTestCase(unittest.TestCase):
+    def _parse(self, args_json):
+        return parse_message('{"type":"t","args":%s}' % args_json)
+
+    def test_plain_message(self):
+        self.assertEqual(self._parse('{"a":[1,"x",null]}'), ('t', {'a': [1, 'x', None]}))
+
+    def test_big_int(self):
+        self.assertEqual(self._parse('{"a":%d}' % 2 ** 70), ('t', {'a': 2 ** 70}))
+        self.assertEqual(self._parse('{"a":%d}' % -2 ** 64), ('t', {'a': -2 ** 64}))
+
+    def test_nan_and_infinity(self):
+        _, args = self._parse('{"a":NaN,"b":Infinity}')
+        self.assertTrue(math.isnan(args['a']))
+        self.assertEqual(args['b'], math.inf)
+
+    def test_lone_surrogate(self):
+        self.assertEqual(self._parse('{"a":"\\ud800"}'), ('t', {'a': '\ud800'}))
+
+
+def update(changes, action_id):
+    return ('update',), {'changes': changes, 'action_id': action_id}
+
+
+class MergeUpdatesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client_manager = make_client_manager()
+        self.a = add_client(self.client_manager, 1)
+        self.b = add_client(self.client_manager, 2)
+
+    def _merge(self, items):
+        return [
+            (client.id, args, kwargs)
+            for client, args, kwargs in self.client_manager._merge_updates(items)
+        ]
+
+    def test_adjacent_updates_are_merged(self):
+        merged = self._merge([
+            (self.a, *update(['1'], 'x')),
+            (self.a, *update(['2'], 'x')),
+        ])
+        self.assertEqual(merged, [(1, *update(['1', '2'], 'x'))])
+
+    def test_other_clients_do_not_block_merge(self):
+        merged = self._merge([
+            (self.a, *update(['1'], 'x')),
+            (self.b, *update(['2'], 'x')),
+            (self.a, *update(['3'], 'x')),
+        ])
+        self.assertEqual(merged, [
+            (1, *update(['1', '3'], 'x')),
+            (2, *update(['2'], 'x')),
+        ])
+
+    def test_init_blocks_merge(self):
+        merged = self._merge([
+            (self.a, *update(['1'], 'x')),
+            (self.a, ('init',), {'content': {}}),
+            (self.a, *update(['2'], 'x')),
+        ])
+        self.assertEqual(merged, [
+            (1, *update(['1'], 'x')),
+            (1, ('init',), {'content': {}}),
+            (1, *update(['2'], 'x')),
+        ])
+
+    def test_different_action_ids_are_not_merged(self):
+        merged = self._merge([
+            (self.a, *update(['1'], 'x')),
+            (self.a, *update(['2'], 'y')),
+            (self.a, *update(['3'], 'y')),
+        ])
+        self.assertEqual(merged, [
+            (1, *update(['1'], 'x')),
+            (1, *update(['2', '3'], 'y')),
+        ])
+
+
+class RunTestCase(unittest.IsolatedAsyncioTestCase):
+    async def test_skips_removed_clients_and_merges(self):
+        client_manager = make_client_manager()
+        a = add_client(client_manager, 1)
+        b = add_client(client_manager, 2)
+        a.send('update', changes=['{"n":1}'], action_id='x')
+        b.send('init', content={})
+        a.send('update', changes=['{"n":2}'], action_id='x')
+        del client_manager._clients[b.id]
+
+        task = asyncio.create_task(client_manager.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        self.assertEqual(
+            [json.loads(message) for message in a._comm.sent],
+            [{'type': 'update', 'args': {'changes': [{'n': 1}, {'n': 2}], 'action_id': 'x'}}],
+        )
+        self.assertEqual(b._comm.sent, [])
+
+
+class CleanupClientTestCase(unittest.TestCase):
+    def test_cleanup_client(self):
+        client_manager = make_client_manager()
+        a = add_client(client_manager, 1, ['a', 'g'])
+        b = add_client(client_manager, 2, ['a'])
+        disconnected = []
+        client_manager.on_client_disconnect += disconnected.append
+        a.send('init', content={})
+        b.send('init', content={})
+        a.send('update', changes=[], action_id='x')
+
+        client_manager._cleanup_client(a)
+
+        self.assertEqual(disconnected, [1])
+        self.assertNotIn(1, client_manager._clients)
+        self.assertNotIn(1, client_manager._client_subscriptions)
+        self.assertEqual(client_manager._subscriptions['a'], {2})
+        self.assertEqual(client_manager._subscriptions['g'], set())
+        self.assertEqual(
+            [(client.id, args) for client, args, kwargs in queued_items(client_manager)],
+            [(2, ('init',))],
+        )
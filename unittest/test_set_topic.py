@@ -0,0 +1,43 @@
+import unittest
+from topicsync.state_machine.state_machine import StateMachine
+from topicsync.topic import SetTopic
+
+class SetTopicListeners(unittest.TestCase):
+    def _record_listeners(self, topic):
+        appended = []
+        removed = []
+        topic.on_append += appended.append
+        topic.on_remove += removed.append
+        return appended, removed
+
+    def test_set_scalars(self):
+        machine = StateMachine()
+        topic = machine.add_topic('topic', SetTopic, init_value=[1, 2, 3])
+        appended, removed = self._record_listeners(topic)
+        topic.set([2, 3, 4])
+        self.assertEqual(appended, [4])
+        self.assertEqual(removed, [1])
+
+    def test_set_dicts(self):
+        machine = StateMachine()
+        topic = machine.add_topic('topic', SetTopic, init_value=[{'a': 1, 'b': 2}, {'c': 3}])
+        appended, removed = self._record_listeners(topic)
+        topic.set([{'b': 2, 'a': 1}, [4, 5]])
+        self.assertEqual(appended, [[4, 5]])
+        self.assertEqual(removed, [{'c': 3}])
+
+    def test_set_mixed(self):
+        machine = StateMachine()
+        topic = machine.add_topic('topic', SetTopic, init_value=[1, 'a'])
+        appended, removed = self._record_listeners(topic)
+        topic.set(['a', {'b': 2}])
+        self.assertEqual(appended, [{'b': 2}])
+        self.assertEqual(removed, [1])
+
+    def test_set_list_and_its_json_text(self):
+        machine = StateMachine()
+        topic = machine.add_topic('topic', SetTopic, init_value=['[1]'])
+        appended, removed = self._record_listeners(topic)
+        topic.set([[1], 'x'])
+        self.assertEqual(sorted(appended, key=repr), ['x', [1]])
+        self.assertEqual(removed, ['[1]'])